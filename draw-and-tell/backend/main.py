@@ -7,22 +7,38 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from backend.routers import kid_loop, parent_dashboard
-
-app = FastAPI()
-
-# Configure CORS for frontend
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:5173", "http://localhost:5174"],  # Vite dev server default port
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Include routers
-app.include_router(kid_loop.router)
-app.include_router(parent_dashboard.router)
+
+
+def create_app() -> FastAPI:
+    """Build the FastAPI app; routers (and the services they load) are imported here"""
+    from backend.routers import kid_loop, parent_dashboard
+
+    app = FastAPI()
+
+    # Configure CORS for frontend
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:5173", "http://localhost:5174"],  # Vite dev server default port
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Include routers
+    app.include_router(kid_loop.router)
+    app.include_router(parent_dashboard.router)
+
+    return app
+
+
+def __getattr__(name):
+    # Build the module-level `app` on first access so `backend.main:app` keeps
+    # working for uvicorn without importing the routers at import time
+    if name == "app":
+        app = globals()["app"] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # Run the server
 if __name__ == "__main__":
@@ -2,8 +2,9 @@ import re
 import logging
 import hashlib
 import json
+import functools
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple, Any
 from dataclasses import dataclass
 from enum import Enum
 
@@ -13,6 +14,26 @@ import random
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Inappropriate words and their safe alternatives, matched in a single pass
+SANITIZE_REPLACEMENTS = {
+    'fight': 'play',
+    'fights': 'plays',
+    'fighting': 'playing',
+    'war': 'game',
+    'gun': 'toy',
+    'guns': 'toys',
+    'weapon': 'toy',
+    'weapons': 'toys',
+    'scary': 'funny',
+    'monster': 'character',
+    'monsters': 'characters',
+    'adult': 'grown-up',
+    'inappropriate': 'not suitable'
+}
+_SANITIZE_RE = re.compile(
+    r'\b(' + '|'.join(map(re.escape, SANITIZE_REPLACEMENTS)) + r')\b', re.IGNORECASE
+)
+
 class SafetyLevel(Enum):
     SAFE = "safe"
     WARNING = "warning"
@@ -25,6 +46,8 @@ class SafetyResult:
     reason: str
     sanitized_content: str
     violations: List[str]
+    # Violation kinds: "jailbreak", "personal_info" or an inappropriate-content category
+    categories: FrozenSet[str] = frozenset()
 
 class COPPAComplianceService:
     """COPPA-compliant safety service for children's app"""
@@ -141,6 +164,15 @@ class COPPAComplianceService:
             r'(this\s+is\s+)?(a\s+)?(test|experiment|game)',
             r'(let\s+me\s+)?(try\s+)?(something\s+)?(different|else)'
         ]
+        
+        # Compile once: the individual patterns are needed to report which ones hit,
+        # the combined alternation lets clean content skip them in a single scan
+        self._jailbreak_regexes = [
+            (pattern, re.compile(pattern, re.IGNORECASE)) for pattern in self.jailbreak_patterns
+        ]
+        self._jailbreak_any = re.compile(
+            "|".join(f"(?:{pattern})" for pattern in self.jailbreak_patterns), re.IGNORECASE
+        )
 
     def _init_prompt_audit_tests(self):
         """Initialize prompt audit test cases"""
@@ -195,6 +227,7 @@ class COPPAComplianceService:
             )
         
         violations = []
+        categories = set()
         sanitized_content = content
         
         # Check for jailbreak patterns
@@ -206,11 +239,12 @@ class COPPAComplianceService:
                 level=SafetyLevel.BLOCKED,
                 reason="Jailbreak attempt detected",
                 sanitized_content=self._get_safe_fallback(),
-                violations=violations
+                violations=violations,
+                categories=frozenset({'jailbreak'})
             )
         
         # Check for inappropriate content
-        inappropriate_violations = self._check_inappropriate_content(content)
+        inappropriate_violations = self._check_inappropriate_content(content, categories)
         if inappropriate_violations:
             violations.extend(inappropriate_violations)
             sanitized_content = self._sanitize_content(content)
@@ -219,11 +253,12 @@ class COPPAComplianceService:
         personal_info_violations = self._check_personal_info(content)
         if personal_info_violations:
             violations.extend(personal_info_violations)
+            categories.add('personal_info')
             sanitized_content = self._remove_personal_info(content)
         
         # Determine safety level
         if violations:
-            level = SafetyLevel.BLOCKED if any('jailbreak' in v for v in violations) else SafetyLevel.WARNING
+            level = SafetyLevel.BLOCKED if 'jailbreak' in categories else SafetyLevel.WARNING
             is_safe = False  # Any violations make content unsafe
         else:
             level = SafetyLevel.SAFE
@@ -234,7 +269,8 @@ class COPPAComplianceService:
             level=level,
             reason="Content safety check completed",
             sanitized_content=sanitized_content,
-            violations=violations
+            violations=violations,
+            categories=frozenset(categories)
         )
 
     def _check_jailbreak_patterns(self, content: str) -> List[str]:
@@ -242,15 +278,18 @@ class COPPAComplianceService:
         violations = []
         content_lower = content.lower()
         
-        for pattern in self.jailbreak_patterns:
-            if re.search(pattern, content_lower, re.IGNORECASE):
+        if not self._jailbreak_any.search(content_lower):
+            return violations
+        
+        for pattern, regex in self._jailbreak_regexes:
+            if regex.search(content_lower):
                 violations.append(f"jailbreak_pattern: {pattern}")
                 logger.warning(f"Jailbreak pattern detected: {pattern} in content: {content[:100]}...")
         
         return violations
 
-    def _check_inappropriate_content(self, content: str) -> List[str]:
-        """Check for inappropriate content"""
+    def _check_inappropriate_content(self, content: str, categories: Set[str]) -> List[str]:
+        """Check for inappropriate content, adding each matched category to `categories`"""
         violations = []
         content_lower = content.lower()
         
@@ -258,6 +297,7 @@ class COPPAComplianceService:
             for pattern in patterns:
                 if re.search(pattern, content_lower, re.IGNORECASE):
                     violations.append(f"inappropriate_{category}: {pattern}")
+                    categories.add(category)
                     logger.warning(f"Inappropriate content detected: {category} - {pattern}")
         
         return violations
@@ -277,29 +317,8 @@ class COPPAComplianceService:
 
     def _sanitize_content(self, content: str) -> str:
         """Sanitize inappropriate content"""
-        sanitized = content
-        
         # Replace inappropriate words with safe alternatives
-        replacements = {
-            'fight': 'play',
-            'fights': 'plays',
-            'fighting': 'playing',
-            'war': 'game',
-            'gun': 'toy',
-            'guns': 'toys',
-            'weapon': 'toy',
-            'weapons': 'toys',
-            'scary': 'funny',
-            'monster': 'character',
-            'monsters': 'characters',
-            'adult': 'grown-up',
-            'inappropriate': 'not suitable'
-        }
-        
-        for bad_word, good_word in replacements.items():
-            sanitized = re.sub(r'\b' + bad_word + r'\b', good_word, sanitized, flags=re.IGNORECASE)
-        
-        return sanitized
+        return _SANITIZE_RE.sub(lambda match: SANITIZE_REPLACEMENTS[match.group(0).lower()], content)
 
     def _remove_personal_info(self, content: str) -> str:
         """Remove personal information from content"""
@@ -331,18 +350,11 @@ class COPPAComplianceService:
         ]
         return random.choice(safe_fallbacks)
 
-    def audit_prompts(self) -> Dict[str, Any]:
-        """Run comprehensive prompt audit tests"""
-        logger.info("🔍 Starting prompt audit tests...")
-        
-        audit_results = {
-            'timestamp': datetime.now().isoformat(),
-            'total_tests': len(self.audit_tests),
-            'passed_tests': 0,
-            'failed_tests': 0,
-            'test_results': []
-        }
-        
+    @functools.cached_property
+    def _audit_test_results(self) -> Tuple[Dict[str, Any], ...]:
+        """Results of the prompt audit tests; the audit set and patterns are
+        fixed at init, so they are checked once per service"""
+        test_results = []
         for test in self.audit_tests:
             result = self.check_content_safety(test['input'])
             
@@ -351,12 +363,7 @@ class COPPAComplianceService:
             actual_blocked = result.level == SafetyLevel.BLOCKED
             test_passed = expected_blocked == actual_blocked
             
-            if test_passed:
-                audit_results['passed_tests'] += 1
-            else:
-                audit_results['failed_tests'] += 1
-            
-            test_result = {
+            test_results.append({
                 'test_name': test['name'],
                 'input': test['input'],
                 'expected_behavior': test['expected_behavior'],
@@ -364,12 +371,34 @@ class COPPAComplianceService:
                 'passed': test_passed,
                 'violations': result.violations,
                 'sanitized_content': result.sanitized_content
-            }
-            
-            audit_results['test_results'].append(test_result)
+            })
             
             logger.info(f"Test '{test['name']}': {'PASSED' if test_passed else 'FAILED'}")
         
+        return tuple(test_results)
+
+    def audit_prompts(self) -> Dict[str, Any]:
+        """Run comprehensive prompt audit tests
+
+        The checks run once per service; every call gets a new report with the
+        current timestamp, which callers are free to modify.
+        """
+        logger.info("🔍 Starting prompt audit tests...")
+        
+        test_results = [
+            dict(test_result, violations=list(test_result['violations']))
+            for test_result in self._audit_test_results
+        ]
+        passed_tests = sum(test_result['passed'] for test_result in test_results)
+        
+        audit_results = {
+            'timestamp': datetime.now().isoformat(),
+            'total_tests': len(test_results),
+            'passed_tests': passed_tests,
+            'failed_tests': len(test_results) - passed_tests,
+            'test_results': test_results
+        }
+        
         # Overall audit status
         audit_results['overall_status'] = 'PASSED' if audit_results['failed_tests'] == 0 else 'FAILED'
         audit_results['pass_rate'] = audit_results['passed_tests'] / audit_results['total_tests']
@@ -1,10 +1,15 @@
 import torch
 import numpy as np
 import io
+import os
 import re
 import logging
 import hashlib
+import struct
+import tempfile
+from contextlib import nullcontext
 from functools import lru_cache
+from pathlib import Path
 from transformers import SpeechT5Processor, SpeechT5ForTextToSpeech, SpeechT5HifiGan
 from datasets import load_dataset
 import soundfile as sf
@@ -17,27 +22,54 @@ from backend.services.safety_service import safety_service
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# TTS model, vocoder and speaker; together they identify the voice in cache keys
+TTS_MODEL_NAME = "sjdata/speecht5_finetuned_single_speaker_de_small_librivox"
+TTS_VOCODER_NAME = "microsoft/speecht5_hifigan"
+TTS_SPEAKER_INDEX = 7306
+
+# On-disk WAV cache (L2 behind the in-memory LRU), survives process restarts.
+# It lives in the user's cache dir, not a shared location like /tmp, and is
+# only used while private to this user, since cached audio is played to kids
+TTS_CACHE_DIR = Path(os.environ.get(
+    "TTS_CACHE_DIR",
+    Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "draw_and_tell" / "tts"
+))
+TTS_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Size of the RIFF/fmt/data header soundfile writes for 16-bit PCM WAV
+WAV_HEADER_SIZE = 44
+
 class TTSService:
     def __init__(self):
         try:
             # Load TTS models
-            self.processor = SpeechT5Processor.from_pretrained("sjdata/speecht5_finetuned_single_speaker_de_small_librivox")
-            self.model = SpeechT5ForTextToSpeech.from_pretrained("sjdata/speecht5_finetuned_single_speaker_de_small_librivox")
-            self.vocoder = SpeechT5HifiGan.from_pretrained("microsoft/speecht5_hifigan")
+            self.processor = SpeechT5Processor.from_pretrained(TTS_MODEL_NAME)
+            self.model = SpeechT5ForTextToSpeech.from_pretrained(TTS_MODEL_NAME)
+            self.vocoder = SpeechT5HifiGan.from_pretrained(TTS_VOCODER_NAME)
             
             # Load speaker embeddings for better voice quality
             try:
                 embeddings_dataset = load_dataset("Matthijs/cmu-arctic-xvectors", split="validation")
-                self.speaker_embeddings = torch.tensor(embeddings_dataset[7306]["xvector"]).unsqueeze(0)
+                self.speaker_embeddings = torch.tensor(embeddings_dataset[TTS_SPEAKER_INDEX]["xvector"]).unsqueeze(0)
+                speaker = f"cmu-arctic-{TTS_SPEAKER_INDEX}"
             except Exception as e:
                 logger.warning(f"Could not load speaker embeddings: {e}")
                 self.speaker_embeddings = torch.randn(1, 512)
+                speaker = "random"
+            
+            # Part of every cache key, so a model or voice change misses old audio
+            self.voice_id = f"{TTS_MODEL_NAME}|{TTS_VOCODER_NAME}|{speaker}"
             
             # Move models to GPU if available
             self.device = "cuda:0" if torch.cuda.is_available() else "cpu"
             self.model = self.model.to(self.device)
             self.vocoder = self.vocoder.to(self.device)
-            self.speaker_embeddings = self.speaker_embeddings.to(self.device)
+            # Contiguous, and in the vocoder's precision (fp16 on GPU), so every
+            # generate_speech call can use the embedding without a cast or copy
+            self.speaker_embeddings = self.speaker_embeddings.contiguous().to(
+                self.device,
+                dtype=torch.float16 if self.device != "cpu" else torch.float32
+            )
             
             # Set models to evaluation mode
             self.model.eval()
@@ -71,15 +103,6 @@ class TTSService:
                 torch.backends.cudnn.deterministic = False
                 logger.info("🚀 Enabled fp16 and CUDA optimizations")
             
-            # Set channels_last memory format for GPU
-            if self.device != "cpu":
-                try:
-                    self.model = self.model.to(memory_format=torch.channels_last)
-                    self.vocoder = self.vocoder.to(memory_format=torch.channels_last)
-                    logger.info("🚀 Optimized memory format (channels_last)")
-                except Exception as e:
-                    logger.warning(f"Memory format optimization failed: {e}")
-            
             # Compile models (PyTorch 2.0+)
             if hasattr(torch, "compile"):
                 try:
@@ -99,13 +122,101 @@ class TTSService:
 
 
     def _get_text_hash(self, text: str) -> str:
-        """Generate a hash for text caching"""
-        return hashlib.md5(text.encode('utf-8')).hexdigest()
+        """Generate a hash for text caching, keyed on the voice as well as the text"""
+        return hashlib.md5(f"{self.voice_id}\n{text}".encode('utf-8')).hexdigest()
 
     @lru_cache(maxsize=50)
     def _cached_tts_generation(self, text_hash: str, text: str) -> bytes:
-        """Cached TTS generation for repeated texts"""
-        return self._generate_audio_internal(text)
+        """Cached TTS generation for repeated texts (memory LRU backed by disk).
+
+        Only audio that passes validation is cached. Otherwise this raises
+        ValueError, which lru_cache does not cache, so the next call retries.
+        """
+        audio_data = self._read_disk_cache(text_hash)
+        if audio_data:
+            if self._validate_audio_output(audio_data):
+                return audio_data
+            logger.warning("Cached audio failed validation, regenerating")
+            (TTS_CACHE_DIR / f"{text_hash}.wav").unlink(missing_ok=True)
+
+        audio_data = self._generate_audio_internal(text)
+        if not audio_data:
+            raise ValueError("Failed to generate audio")
+        if not self._validate_audio_output(audio_data):
+            raise ValueError("Generated audio failed validation")
+
+        self._write_disk_cache(text_hash, audio_data)
+        return audio_data
+
+    def _disk_cache_ready(self) -> bool:
+        """Create the disk cache dir if needed; use it only if it is private to this user"""
+        try:
+            TTS_CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+            stat = TTS_CACHE_DIR.stat()
+        except Exception as e:
+            logger.warning(f"Could not create TTS disk cache: {e}")
+            return False
+        
+        # Anyone else who can write here could plant audio that gets played
+        if hasattr(os, "getuid") and (stat.st_uid != os.getuid() or stat.st_mode & 0o022):
+            logger.warning(f"Not using TTS disk cache {TTS_CACHE_DIR}: it is not private to this user")
+            return False
+        return True
+
+    def _read_disk_cache(self, text_hash: str) -> Optional[bytes]:
+        """Return cached WAV bytes from disk, or None on a miss"""
+        if not self._disk_cache_ready():
+            return None
+        path = TTS_CACHE_DIR / f"{text_hash}.wav"
+        try:
+            audio_data = path.read_bytes()
+            # Bump access time so the LRU sweep keeps recently used entries
+            os.utime(path)
+            return audio_data
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Could not read TTS disk cache: {e}")
+            return None
+
+    def _write_disk_cache(self, text_hash: str, audio_data: bytes):
+        """Atomically store WAV bytes on disk and keep the cache bounded"""
+        if not self._disk_cache_ready():
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=TTS_CACHE_DIR, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(audio_data)
+                os.replace(tmp_path, TTS_CACHE_DIR / f"{text_hash}.wav")
+            except Exception:
+                os.unlink(tmp_path)
+                raise
+            self._sweep_disk_cache()
+        except Exception as e:
+            logger.warning(f"Could not write TTS disk cache: {e}")
+
+    def _sweep_disk_cache(self):
+        """Evict least recently used WAVs once the cache exceeds its size budget"""
+        entries = []
+        for path in TTS_CACHE_DIR.glob("*.wav"):
+            try:
+                entries.append((path.stat(), path))
+            except FileNotFoundError:
+                continue
+
+        total_size = sum(stat.st_size for stat, _ in entries)
+        if total_size <= TTS_CACHE_MAX_BYTES:
+            return
+
+        for stat, path in sorted(entries, key=lambda entry: entry[0].st_atime):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total_size -= stat.st_size
+            if total_size <= TTS_CACHE_MAX_BYTES:
+                break
 
     def _generate_audio_internal(self, text: str) -> Optional[bytes]:
         """Internal audio generation without caching"""
@@ -114,22 +225,19 @@ class TTSService:
             inputs = self.processor(text=text, return_tensors="pt")
             inputs = {k: v.to(self.device, non_blocking=True) for k, v in inputs.items()}
             
+            # Use mixed precision if available on GPU
+            if self.device != "cpu" and hasattr(torch.cuda, 'amp'):
+                precision_ctx = torch.cuda.amp.autocast(dtype=torch.float16)
+            else:
+                precision_ctx = nullcontext()
+            
             # Generate speech with optimizations
-            with torch.no_grad():
-                # Use mixed precision if available on GPU
-                if self.device != "cpu" and hasattr(torch.cuda, 'amp'):
-                    with torch.cuda.amp.autocast():
-                        speech = self.model.generate_speech(
-                            inputs["input_ids"], 
-                            self.speaker_embeddings, 
-                            vocoder=self.vocoder
-                        )
-                else:
-                    speech = self.model.generate_speech(
-                        inputs["input_ids"], 
-                        self.speaker_embeddings, 
-                        vocoder=self.vocoder
-                    )
+            with torch.inference_mode(), precision_ctx:
+                speech = self.model.generate_speech(
+                    inputs["input_ids"], 
+                    self.speaker_embeddings, 
+                    vocoder=self.vocoder
+                )
             
             # Convert to numpy array and normalize safely
             speech = speech.cpu().numpy()
@@ -139,10 +247,10 @@ class TTSService:
                 logger.warning("Generated speech contains NaN or infinite values")
                 return None
             
-            # Normalize audio safely
-            max_val = np.max(np.abs(speech))
+            # Normalize audio safely (in place, no second audio-sized buffer)
+            max_val = float(np.abs(speech).max())
             if max_val > 0:
-                speech = speech / max_val
+                np.divide(speech, max_val, out=speech)
             else:
                 logger.warning("Generated speech has zero amplitude")
                 return None
@@ -202,7 +310,29 @@ class TTSService:
                 logger.warning("Generated audio too large")
                 return False
             
-            # Try to read the audio data to validate format
+            # Fast path: parse the canonical 44-byte WAV header directly; the
+            # payload is only read as int16 samples for 16-bit PCM (format 1)
+            header = audio_data[:WAV_HEADER_SIZE]
+            if (header[0:4] == b"RIFF" and header[8:12] == b"WAVE"
+                    and header[12:16] == b"fmt " and header[36:40] == b"data"
+                    and struct.unpack("<H", header[20:22])[0] == 1
+                    and struct.unpack("<H", header[34:36])[0] == 16):
+                sample_rate = struct.unpack("<I", header[24:28])[0]
+                if sample_rate != 16000:
+                    logger.warning(f"Unexpected sample rate: {sample_rate}")
+                    return False
+                
+                # Check for silence on the first few KB, scanning the rest only if needed
+                payload = memoryview(audio_data)[WAV_HEADER_SIZE:]
+                payload = payload[:len(payload) - len(payload) % 2]
+                if not (np.frombuffer(payload[:4096], dtype="<i2").any()
+                        or np.frombuffer(payload[4096:], dtype="<i2").any()):
+                    logger.warning("Generated audio is silent")
+                    return False
+                
+                return True
+            
+            # Fall back to a full decode for non-canonical headers
             with io.BytesIO(audio_data) as audio_io:
                 data, sample_rate = sf.read(audio_io)
                 if sample_rate != 16000:
@@ -239,32 +369,14 @@ class TTSService:
                 logger.warning("No safe text to convert to speech")
                 return None
             
-            # Check cache first for repeated texts
+            # Cached audio for repeated texts, generated and validated on a miss
             text_hash = self._get_text_hash(safe_text)
-            cached_audio = self._cached_tts_generation(text_hash, safe_text)
-            
-            if cached_audio:
-                logger.debug(f"Using cached audio for text: {safe_text[:30]}...")
-                # Validate cached audio
-                if self._validate_audio_output(cached_audio):
-                    return cached_audio
-                else:
-                    logger.warning("Cached audio failed validation, regenerating")
-            
-            # Generate new audio if not cached or validation failed
-            audio_data = self._generate_audio_internal(safe_text)
-            
-            if not audio_data:
-                logger.warning("Failed to generate audio")
-                return None
-            
-            # Validate generated audio
-            if not self._validate_audio_output(audio_data):
-                logger.warning("Generated audio failed validation")
+            try:
+                return self._cached_tts_generation(text_hash, safe_text)
+            except ValueError as e:
+                logger.warning(str(e))
                 return None
             
-            return audio_data
-            
         except Exception as e:
             logger.error(f"Error in text_to_speech: {str(e)}")
             return None
@@ -276,9 +388,9 @@ class TTSService:
         if not question:
             return None
             
-        # Don't add extra text to questions - keep them clean
-        safe_question = self._sanitize_text(question)
-        return self.text_to_speech(safe_question, text_type="question")
+        # Don't add extra text to questions - keep them clean; text_to_speech
+        # sanitizes it
+        return self.text_to_speech(question, text_type="question")
 
     def generate_response_audio(self, response: str) -> Optional[bytes]:
         """
@@ -287,10 +399,9 @@ class TTSService:
         if not response:
             return None
             
-        # Add encouraging phrases safely
+        # Add encouraging phrases; text_to_speech sanitizes the result
         enhanced_response = f"Wow! {response} That's amazing!"
-        safe_response = self._sanitize_text(enhanced_response)
-        return self.text_to_speech(safe_response, text_type="response")
+        return self.text_to_speech(enhanced_response, text_type="response")
 
     def clear_cache(self):
         """Clear the TTS cache to free memory"""
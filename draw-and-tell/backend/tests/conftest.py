@@ -0,0 +1,113 @@
+import copy
+from types import SimpleNamespace
+from unittest.mock import create_autospec
+
+import freezegun
+import pytest
+import pytest_asyncio
+
+# Services mocked for the kid loop router. They run their models in-process and
+# make no HTTP calls, so they are replaced at the object level rather than with
+# a mocked HTTP transport.
+KID_LOOP_SERVICES = (
+    "cv_service",
+    "asr_service",
+    "tts_service",
+    "safety_service",
+    "local_storage",
+    "prompt_service",
+)
+
+# Types the kid loop services are specced from, looked up on first use
+_SPEC_TYPES = {}
+
+# Audio returned by the mocked TTS service
+_FAKE_AUDIO = b"fake_audio_data"
+
+# Prototype safety check results; fixtures hand out shallow copies. They are
+# plain data, so SimpleNamespace is enough.
+_SAFE = SimpleNamespace(is_safe=True, level=None, violations=[], sanitized_content="")
+_UNSAFE = SimpleNamespace(is_safe=False, level=None, violations=["inappropriate_content"], sanitized_content="")
+
+
+@pytest.fixture(scope="session")
+def prompt_service():
+    """PromptService shared by the whole session; it holds no per-call state"""
+    from backend.services.prompt_service import PromptService
+    return PromptService()
+
+
+@pytest.fixture(scope="session")
+def safety_service():
+    """COPPAComplianceService shared by the whole session; it holds no per-call state"""
+    from services.safety_service import COPPAComplianceService
+    return COPPAComplianceService()
+
+
+@pytest.fixture(scope="session")
+def app():
+    """FastAPI application shared by every endpoint test"""
+    from main import create_app
+    return create_app()
+
+
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def aclient(app):
+    """Single async client for the session, talking to the app in-process"""
+    from httpx import ASGITransport, AsyncClient
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture
+def frozen_time():
+    """Freeze the clock so timestamps in the handlers are constant.
+
+    asyncio is ignored so the event loop keeps its own monotonic clock.
+    """
+    with freezegun.freeze_time("2024-01-01", ignore=["asyncio"]) as frozen:
+        yield frozen
+
+
+@pytest.fixture
+def safe_result():
+    """Safety check result that passes; set `sanitized_content` as needed"""
+    return copy.copy(_SAFE)
+
+
+@pytest.fixture
+def unsafe_result():
+    """Safety check result that fails; set `sanitized_content` as needed"""
+    return copy.copy(_UNSAFE)
+
+
+def _service_spec_type(name):
+    """Return the type to spec one of the router's service singletons from"""
+    service_type = _SPEC_TYPES.get(name)
+    if service_type is None:
+        from backend.routers import kid_loop
+        from backend.utils.local_storage import LocalStorage, _LazyStorage
+        service = getattr(kid_loop, name)
+        # local_storage is a lazy proxy; spec the class it stands in for
+        service_type = LocalStorage if isinstance(service, _LazyStorage) else type(service)
+        _SPEC_TYPES[name] = service_type
+    return service_type
+
+
+@pytest.fixture
+def services(monkeypatch):
+    """Replace every service used by the kid loop router with an autospecced mock.
+
+    The app is served from `backend.routers.kid_loop`, so that is the module
+    patched here; tests set return values on the returned namespace. Each test
+    gets freshly built autospecs, so no mock state leaks between tests.
+    """
+    mocks = {}
+    for name in KID_LOOP_SERVICES:
+        mock = create_autospec(_service_spec_type(name), instance=True, spec_set=True)
+        monkeypatch.setattr(f"backend.routers.kid_loop.{name}", mock)
+        mocks[name] = mock
+    mocks["safety_service"].validate_data_collection.return_value = (True, [])
+    mocks["tts_service"].generate_question_audio.return_value = _FAKE_AUDIO
+    mocks["tts_service"].generate_response_audio.return_value = _FAKE_AUDIO
+    return SimpleNamespace(**mocks)
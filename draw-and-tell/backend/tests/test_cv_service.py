@@ -1,29 +1,38 @@
 import pytest
-import sys
-import os
-from unittest.mock import patch, MagicMock, mock_open
-from PIL import Image
-import tempfile
-import io
-
-# Add the backend directory to the path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from unittest.mock import patch, MagicMock
 
 from services.cv_service import CVService
 
+@pytest.fixture(scope="module")
+def cv_service():
+    """Build a single CVService with a mocked processor and model for the module"""
+    with patch('services.cv_service.AutoProcessor') as mock_processor, \
+         patch('services.cv_service.AutoModelForVision2Seq') as mock_model:
+        
+        # Mock the processor and model
+        mock_processor.from_pretrained.return_value = MagicMock()
+        mock_model.from_pretrained.return_value = MagicMock()
+        
+        yield CVService()
+
 class TestCVService:
     """Test cases for Computer Vision service"""
     
-    def setup_method(self):
-        """Set up test fixtures"""
-        with patch('services.cv_service.AutoProcessor') as mock_processor, \
-             patch('services.cv_service.AutoModelForVision2Seq') as mock_model:
-            
-            # Mock the processor and model
-            mock_processor.from_pretrained.return_value = MagicMock()
-            mock_model.from_pretrained.return_value = MagicMock()
-            
-            self.cv_service = CVService()
+    @pytest.fixture(autouse=True)
+    def _use_shared_service(self, cv_service):
+        """Expose the shared service and reset the mocked processor/model between tests"""
+        cv_service.processor.reset_mock(return_value=True, side_effect=True)
+        cv_service.model.reset_mock(return_value=True, side_effect=True)
+        self.cv_service = cv_service
+    
+    @pytest.fixture
+    def stub_questions(self, monkeypatch, cv_service):
+        """Stub _generate_questions; tests set `stub_questions.ret` to change the result"""
+        def _stub(caption):
+            return _stub.ret
+        _stub.ret = ["What colors did you use?"]
+        monkeypatch.setattr(cv_service, "_generate_questions", _stub)
+        return _stub
     
     def test_initialization(self):
         """Test service initialization"""
@@ -44,7 +53,7 @@ class TestCVService:
     
     @patch('services.cv_service.Image.open')
     @patch('services.cv_service.safety_service.check_content_safety')
-    def test_analyze_drawing_success(self, mock_safety_check, mock_image_open):
+    def test_analyze_drawing_success(self, mock_safety_check, mock_image_open, stub_questions):
         """Test successful drawing analysis"""
         # Mock image
         mock_image = MagicMock()
@@ -71,17 +80,13 @@ class TestCVService:
             sanitized_content="a drawing of a car"
         )
         
-        # Mock question generation
-        with patch.object(self.cv_service, '_generate_questions') as mock_generate_questions:
-            mock_generate_questions.return_value = ["What colors did you use?"]
-            
-            result = self.cv_service.analyze_drawing("/tmp/test_image.jpg")
-            
-            assert result["success"] == True
-            assert "caption" in result
-            assert "question" in result
-            assert result["caption"] == "a drawing of a car"
-            assert result["question"] == "What colors did you use?"
+        result = self.cv_service.analyze_drawing("/tmp/test_image.jpg")
+        
+        assert result["success"] == True
+        assert "caption" in result
+        assert "question" in result
+        assert result["caption"] == "a drawing of a car"
+        assert result["question"] == "What colors did you use?"
     
     @patch('services.cv_service.Image.open')
     def test_analyze_drawing_image_error(self, mock_image_open):
@@ -98,7 +103,7 @@ class TestCVService:
     
     @patch('services.cv_service.Image.open')
     @patch('services.cv_service.safety_service.check_content_safety')
-    def test_analyze_drawing_unsafe_caption(self, mock_safety_check, mock_image_open):
+    def test_analyze_drawing_unsafe_caption(self, mock_safety_check, mock_image_open, stub_questions):
         """Test drawing analysis with unsafe caption"""
         # Mock image
         mock_image = MagicMock()
@@ -125,19 +130,15 @@ class TestCVService:
             sanitized_content="a character with toys"
         )
         
-        # Mock question generation
-        with patch.object(self.cv_service, '_generate_questions') as mock_generate_questions:
-            mock_generate_questions.return_value = ["What colors did you use?"]
-            
-            result = self.cv_service.analyze_drawing("/tmp/test_image.jpg")
-            
-            assert result["success"] == True
-            assert result["caption"] == "a character with toys"  # Sanitized
-            assert result["question"] == "What colors did you use?"
+        result = self.cv_service.analyze_drawing("/tmp/test_image.jpg")
+        
+        assert result["success"] == True
+        assert result["caption"] == "a character with toys"  # Sanitized
+        assert result["question"] == "What colors did you use?"
     
     @patch('services.cv_service.Image.open')
     @patch('services.cv_service.safety_service.check_content_safety')
-    def test_analyze_drawing_unsafe_question(self, mock_safety_check, mock_image_open):
+    def test_analyze_drawing_unsafe_question(self, mock_safety_check, mock_image_open, stub_questions):
         """Test drawing analysis with unsafe question"""
         # Mock image
         mock_image = MagicMock()
@@ -176,14 +177,13 @@ class TestCVService:
         mock_safety_check.side_effect = mock_safety_side_effect
         
         # Mock question generation
-        with patch.object(self.cv_service, '_generate_questions') as mock_generate_questions:
-            mock_generate_questions.return_value = ["Tell me about violence and weapons"]
-            
-            result = self.cv_service.analyze_drawing("/tmp/test_image.jpg")
-            
-            assert result["success"] == True
-            assert result["caption"] == "a drawing of a car"
-            assert result["question"] == "What colors did you use?"  # Sanitized
+        stub_questions.ret = ["Tell me about violence and weapons"]
+        
+        result = self.cv_service.analyze_drawing("/tmp/test_image.jpg")
+        
+        assert result["success"] == True
+        assert result["caption"] == "a drawing of a car"
+        assert result["question"] == "What colors did you use?"  # Sanitized
     
     def test_generate_questions_car_theme(self):
         """Test question generation for car-themed drawings"""
@@ -320,7 +320,7 @@ class TestCVService:
             # The actual test would be in the analyze_drawing method
             pass
     
-    def test_model_generation_parameters(self):
+    def test_model_generation_parameters(self, stub_questions):
         """Test that model generation uses safe parameters"""
         # This test would verify that the model.generate call uses appropriate parameters
         # for conservative, kid-friendly output
@@ -338,16 +338,15 @@ class TestCVService:
             
             self.cv_service.processor.decode.return_value = "test caption"
             
-            with patch.object(self.cv_service, '_generate_questions') as mock_generate_questions:
-                mock_generate_questions.return_value = ["test question"]
-                
-                self.cv_service.analyze_drawing("/tmp/test.jpg")
-                
-                # Verify model.generate was called with safe parameters
-                self.cv_service.model.generate.assert_called_once()
-                call_kwargs = self.cv_service.model.generate.call_args[1]
-                
-                assert call_kwargs['max_length'] == 50
-                assert call_kwargs['temperature'] == 0.7  # Conservative temperature
-                assert call_kwargs['do_sample'] == True
-                assert 'repetition_penalty' in call_kwargs
+            stub_questions.ret = ["test question"]
+            
+            self.cv_service.analyze_drawing("/tmp/test.jpg")
+            
+            # Verify model.generate was called with safe parameters
+            self.cv_service.model.generate.assert_called_once()
+            call_kwargs = self.cv_service.model.generate.call_args[1]
+            
+            assert call_kwargs['max_length'] == 50
+            assert call_kwargs['temperature'] == 0.7  # Conservative temperature
+            assert call_kwargs['do_sample'] == True
+            assert 'repetition_penalty' in call_kwargs
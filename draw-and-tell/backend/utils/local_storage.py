@@ -1,87 +1,250 @@
 import sqlite3
 import os
+import logging
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Optional, List, Dict, Any
-import json
-import base64
+import orjson
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
+# Sequence number appended to media file names, so files saved within the
+# same second do not overwrite each other
+_file_seq = itertools.count()
+
+# Worker threads for writing media files in parallel
+_file_writer = ThreadPoolExecutor(max_workers=4, thread_name_prefix="storage-writer")
+
 class LocalStorage:
     """
     Manages local storage of drawing sessions, responses, and images using SQLite.
     """
     
-    def __init__(self):
-        """Initialize the database and create tables if they don't exist."""
+    # Per-connection settings: foreign keys are enforced, WAL only needs NORMAL
+    # sync to stay consistent, and temp tables / a 64MB page cache are kept in memory
+    CONNECTION_PRAGMAS = (
+        "PRAGMA foreign_keys=ON",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-64000",
+    )
+    
+    # Tags are keyed by (drawing_id, tag) without a rowid; {name} lets the
+    # migration build the new table next to an old one. A tag repeated for one
+    # drawing is stored once (INSERT OR IGNORE), and a drawing's tags read back
+    # in sorted order, not the order they were saved in
+    TAGS_TABLE_SQL = '''
+        CREATE TABLE IF NOT EXISTS {name} (
+            drawing_id INTEGER NOT NULL,
+            tag TEXT NOT NULL,
+            PRIMARY KEY (drawing_id, tag),
+            FOREIGN KEY (drawing_id) REFERENCES drawings (id)
+        ) WITHOUT ROWID
+    '''
+    
+    def __init__(self, db_path: Optional[str] = None, data_dir: Optional[str] = None):
+        """
+        Initialize the database and create tables if they don't exist.
+        
+        Args:
+            db_path: Optional database path; defaults to draw_and_tell.db in data_dir.
+                Pass ":memory:" for a private in-memory database.
+            data_dir: Optional directory for the database and the image and audio
+                files; defaults to draw-and-tell/data. Tests point it at a temp dir.
+        """
         # Ensure data directory exists
-        self.data_dir = Path(__file__).parent.parent.parent / "data"
+        self.data_dir = Path(data_dir) if data_dir is not None else Path(__file__).parent.parent.parent / "data"
         self.images_dir = self.data_dir / "images"
-        self.db_path = self.data_dir / "draw_and_tell.db"
+        self.audio_dir = self.data_dir / "audio"
+        self.db_path = db_path if db_path is not None else self.data_dir / "draw_and_tell.db"
         
         # Create directories if they don't exist
         self.data_dir.mkdir(exist_ok=True)
         self.images_dir.mkdir(exist_ok=True)
+        self.audio_dir.mkdir(exist_ok=True)
+        
+        # One long-lived connection shared by all threads; the lock serializes
+        # access to it and is reentrant so transaction() can wrap other calls
+        self._lock = threading.RLock()
+        self._conn = self._connect()
+        # Nesting depth of _connection() calls; only read and written under the lock
+        self._tx_depth = 0
         
         # Initialize database
         self._init_db()
     
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Open the storage connection. It runs in autocommit mode, so transactions
+        are begun and committed explicitly by _connection().
+        """
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        # Rows can be read by column name or by index
+        conn.row_factory = sqlite3.Row
+        for pragma in self.CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        # WAL is stored in the database file and does not apply to in-memory databases
+        if self.db_path != ":memory:":
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+    
+    def close(self):
+        """Close the storage connection; the storage cannot be used afterwards."""
+        with self._lock:
+            self._conn.close()
+    
+    def _debug_cursor(self) -> sqlite3.Cursor:
+        """Return a cursor on the storage connection, for inspecting the database in tests."""
+        return self._conn.cursor()
+    
+    @contextmanager
+    def _connection(self):
+        """
+        Yield the connection for a single operation, run in its own transaction.
+        Inside transaction() the operation joins the open transaction instead.
+        """
+        with self._lock:
+            conn = self._conn
+            if self._tx_depth:
+                # Join the transaction this thread already has open
+                self._tx_depth += 1
+                try:
+                    yield conn
+                finally:
+                    self._tx_depth -= 1
+                return
+            
+            self._tx_depth = 1
+            conn.execute("BEGIN")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                # Also covers a failed COMMIT, which would otherwise leave the
+                # connection inside a transaction that is never committed
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._tx_depth = 0
+    
+    @contextmanager
+    def transaction(self):
+        """
+        Group several storage calls into one transaction with a single commit.
+        Nested calls join the outer transaction.
+        """
+        with self._connection():
+            yield
+    
+    @contextmanager
+    def _remove_files_on_error(self, paths):
+        """Delete the media files written for a record if saving the record fails."""
+        try:
+            yield
+        except BaseException:
+            for path in paths:
+                if path is not None:
+                    path.unlink(missing_ok=True)
+            raise
+    
     def _init_db(self):
         """Create database tables if they don't exist and migrate existing tables."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        # The whole schema is one script run in a single transaction
+        schema = f'''
+            BEGIN;
             
-            # Create sessions table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS sessions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT NOT NULL,
-                    prompt TEXT NOT NULL
-                )
-            ''')
+            -- Create sessions table
+            CREATE TABLE IF NOT EXISTS sessions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL,
+                prompt TEXT NOT NULL
+            );
             
-            # Create drawings table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS drawings (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id INTEGER NOT NULL,
-                    image_path TEXT NOT NULL,
-                    caption TEXT,
-                    analysis TEXT,
-                    timestamp TEXT NOT NULL,
-                    FOREIGN KEY (session_id) REFERENCES sessions (id)
-                )
-            ''')
+            -- Create drawings table
+            CREATE TABLE IF NOT EXISTS drawings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id INTEGER NOT NULL,
+                image_path TEXT NOT NULL,
+                caption TEXT,
+                analysis TEXT,
+                timestamp TEXT NOT NULL,
+                FOREIGN KEY (session_id) REFERENCES sessions (id)
+            );
             
-            # Create responses table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS responses (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    drawing_id INTEGER NOT NULL,
-                    question TEXT NOT NULL,
-                    answer TEXT,
-                    answer_audio_path TEXT,
-                    question_audio_path TEXT,
-                    response TEXT,
-                    response_audio_path TEXT,
-                    timestamp TEXT NOT NULL,
-                    FOREIGN KEY (drawing_id) REFERENCES drawings (id)
-                )
-            ''')
+            -- Create responses table
+            CREATE TABLE IF NOT EXISTS responses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                drawing_id INTEGER NOT NULL,
+                question TEXT NOT NULL,
+                answer TEXT,
+                answer_audio_path TEXT,
+                question_audio_path TEXT,
+                response TEXT,
+                response_audio_path TEXT,
+                timestamp TEXT NOT NULL,
+                FOREIGN KEY (drawing_id) REFERENCES drawings (id)
+            );
             
-            # Create tags table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS tags (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    drawing_id INTEGER NOT NULL,
-                    tag TEXT NOT NULL,
-                    FOREIGN KEY (drawing_id) REFERENCES drawings (id)
-                )
-            ''')
+            -- Create tags table; rows are stored in (drawing_id, tag) order, so
+            -- looking up a drawing's tags needs no separate index
+            {self.TAGS_TABLE_SQL.format(name="tags")};
             
-            # Migrate existing responses table if needed
+            -- Index the foreign keys get_session looks rows up by
+            CREATE INDEX IF NOT EXISTS idx_drawings_session ON drawings (session_id);
+            CREATE INDEX IF NOT EXISTS idx_responses_drawing ON responses (drawing_id);
+            
+            COMMIT;
+        '''
+        with self._lock:
+            try:
+                self._conn.executescript(schema)
+            except Exception:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                raise
+        
+        # Migrate existing tables if needed; both return early once up to date
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            self._migrate_tags_table(cursor)
             self._migrate_responses_table(cursor)
+    
+    def _migrate_tags_table(self, cursor):
+        """Migrate a tags table with an id column to the WITHOUT ROWID layout."""
+        try:
+            cursor.execute("PRAGMA table_info(tags)")
+            columns = [column[1] for column in cursor.fetchall()]
+            if 'id' not in columns:
+                return  # Already on the new schema
+            
+            logger.info("🔄 Migrating tags table to (drawing_id, tag) keys...")
+            # The swap is all or nothing: without the savepoint, a failure after
+            # DROP TABLE would be committed with no tags table at all
+            cursor.execute("SAVEPOINT migrate_tags")
+            try:
+                cursor.execute(self.TAGS_TABLE_SQL.format(name="tags_new"))
+                # Tags of missing drawings are unreachable and would fail the foreign key
+                cursor.execute('''
+                    INSERT OR IGNORE INTO tags_new (drawing_id, tag)
+                    SELECT drawing_id, tag FROM tags WHERE drawing_id IN (SELECT id FROM drawings)
+                ''')
+                cursor.execute('DROP TABLE tags')
+                cursor.execute('ALTER TABLE tags_new RENAME TO tags')
+            except Exception:
+                cursor.execute("ROLLBACK TO migrate_tags")
+                raise
+            finally:
+                cursor.execute("RELEASE migrate_tags")
+            logger.info("✅ Migrated tags table")
             
-            conn.commit()
+        except Exception as e:
+            # Don't raise the exception, just log it; the old table is left intact
+            logger.warning(f"⚠️  Could not migrate tags table: {str(e)}")
     
     def _migrate_responses_table(self, cursor):
         """Migrate existing responses table to include new TTS columns."""
@@ -95,34 +258,32 @@ class LocalStorage:
             cursor.execute("PRAGMA table_info(responses)")
             columns = [column[1] for column in cursor.fetchall()]
             
-            # Add missing columns
+            # Add missing columns; on an up-to-date database there is nothing to do
             new_columns = [
                 ("question_audio_path", "TEXT"),
                 ("response", "TEXT"),
                 ("response_audio_path", "TEXT")
             ]
+            missing = [(name, type_) for name, type_ in new_columns if name not in columns]
+            if not missing:
+                return
             
-            for column_name, column_type in new_columns:
-                if column_name not in columns:
-                    print(f"🔄 Adding column {column_name} to responses table...")
-                    cursor.execute(f"ALTER TABLE responses ADD COLUMN {column_name} {column_type}")
-                    print(f"✅ Added column {column_name}")
-                else:
-                    print(f"✅ Column {column_name} already exists")
+            for column_name, column_type in missing:
+                cursor.execute(f"ALTER TABLE responses ADD COLUMN {column_name} {column_type}")
+            logger.info(f"✅ Added columns to responses table: {', '.join(name for name, _ in missing)}")
                     
         except Exception as e:
-            print(f"⚠️  Warning: Could not migrate responses table: {str(e)}")
             # Don't raise the exception, just log it
+            logger.warning(f"⚠️  Could not migrate responses table: {str(e)}")
     
     def create_session(self, prompt: str) -> int:
         """Create a new drawing session."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 'INSERT INTO sessions (timestamp, prompt) VALUES (?, ?)',
                 (datetime.now().isoformat(), prompt)
             )
-            conn.commit()
             return cursor.lastrowid
     
     def save_drawing(self, session_id: int, image_data: bytes, caption: str = None, analysis: Dict = None) -> int:
@@ -138,41 +299,94 @@ class LocalStorage:
         Returns:
             ID of the saved drawing
         """
-        # Save image file
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        image_filename = f"drawing_{timestamp}.png"
-        image_path = self.images_dir / image_filename
-        
-        with open(image_path, 'wb') as f:
-            f.write(image_data)
+        # Save image file before the transaction, so a failed write leaves no row
+        # and the write lock is not held during file I/O
+        now = datetime.now()
+        image_path = self.images_dir / f"drawing_{now.strftime('%Y%m%d_%H%M%S')}_{next(_file_seq)}.png"
+        image_path.write_bytes(image_data)
+        row = (
+            session_id,
+            str(image_path),
+            caption,
+            orjson.dumps(analysis).decode() if analysis else None,
+            now.isoformat()
+        )
         
         # Save drawing record
-        with sqlite3.connect(self.db_path) as conn:
+        with self._remove_files_on_error([image_path]), self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO drawings 
                 (session_id, image_path, caption, analysis, timestamp)
                 VALUES (?, ?, ?, ?, ?)
-            ''', (
+            ''', row)
+            
+            drawing_id = cursor.lastrowid
+            
+            # Save tags if present in analysis
+            tags = [(drawing_id, obj) for obj in (analysis or {}).get('objects_detected', ())]
+            if tags:
+                cursor.executemany('INSERT OR IGNORE INTO tags (drawing_id, tag) VALUES (?, ?)', tags)
+            
+            return drawing_id
+    
+    def save_drawings_bulk(self, session_id: int, drawings: List[Dict[str, Any]]) -> List[int]:
+        """
+        Save several drawings for one session with a single batched insert.
+        
+        Args:
+            session_id: ID of the session
+            drawings: Dictionaries of save_drawing arguments
+                (image_data, and optionally caption and analysis)
+        
+        Returns:
+            IDs of the saved drawings, in input order
+        """
+        if not drawings:
+            return []
+        
+        # Save image files
+        now = datetime.now()
+        timestamp = now.strftime('%Y%m%d_%H%M%S')
+        now_iso = now.isoformat()
+        rows = []
+        image_paths = []
+        for drawing in drawings:
+            image_path = self.images_dir / f"drawing_{timestamp}_{next(_file_seq)}.png"
+            image_path.write_bytes(drawing['image_data'])
+            image_paths.append(image_path)
+            analysis = drawing.get('analysis')
+            rows.append((
                 session_id,
                 str(image_path),
-                caption,
-                json.dumps(analysis) if analysis else None,
-                datetime.now().isoformat()
+                drawing.get('caption'),
+                orjson.dumps(analysis).decode() if analysis else None,
+                now_iso
             ))
+        
+        # Save drawing records
+        with self._remove_files_on_error(image_paths), self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT INTO drawings
+                (session_id, image_path, caption, analysis, timestamp)
+                VALUES (?, ?, ?, ?, ?)
+            ''', rows)
             
-            drawing_id = cursor.lastrowid
+            # Rowids are assigned consecutively within the transaction
+            last_id = cursor.execute('SELECT last_insert_rowid()').fetchone()[0]
+            drawing_ids = list(range(last_id - len(rows) + 1, last_id + 1))
             
             # Save tags if present in analysis
-            if analysis and 'objects_detected' in analysis:
-                for obj in analysis['objects_detected']:
-                    cursor.execute(
-                        'INSERT INTO tags (drawing_id, tag) VALUES (?, ?)',
-                        (drawing_id, obj)
-                    )
+            tags = [
+                (drawing_id, obj)
+                for drawing_id, drawing in zip(drawing_ids, drawings)
+                for obj in (drawing.get('analysis') or {}).get('objects_detected', [])
+            ]
+            if tags:
+                cursor.executemany('INSERT OR IGNORE INTO tags (drawing_id, tag) VALUES (?, ?)', tags)
             
-            conn.commit()
-            return drawing_id
+            return drawing_ids
     
     def save_response(self, drawing_id: int, question: str = None, question_id: int = None, 
                      answer: str = None, answer_audio: bytes = None, 
@@ -191,39 +405,26 @@ class LocalStorage:
         Returns:
             ID of the response record
         """
-        # Save audio files if provided
-        audio_path = None
-        question_audio_path = None
-        response_audio_path = None
-        
-        if answer_audio:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            audio_filename = f"answer_{timestamp}.wav"
-            audio_path = self.data_dir / "audio" / audio_filename
-            audio_path.parent.mkdir(exist_ok=True)
-            
-            with open(audio_path, 'wb') as f:
-                f.write(answer_audio)
+        # Save audio files if provided; the writes are independent, so they
+        # run in parallel on the shared writer pool
+        now = datetime.now()
+        now_iso = now.isoformat()
+        suffix = f"{now.strftime('%Y%m%d_%H%M%S')}_{next(_file_seq)}"
+        audio_path = self.audio_dir / f"answer_{suffix}.wav" if answer_audio else None
+        question_audio_path = self.audio_dir / f"question_{suffix}.wav" if question_audio else None
+        response_audio_path = self.audio_dir / f"response_{suffix}.wav" if response_audio else None
         
-        if question_audio:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            audio_filename = f"question_{timestamp}.wav"
-            question_audio_path = self.data_dir / "audio" / audio_filename
-            question_audio_path.parent.mkdir(exist_ok=True)
-            
-            with open(question_audio_path, 'wb') as f:
-                f.write(question_audio)
-        
-        if response_audio:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            audio_filename = f"response_{timestamp}.wav"
-            response_audio_path = self.data_dir / "audio" / audio_filename
-            response_audio_path.parent.mkdir(exist_ok=True)
-            
-            with open(response_audio_path, 'wb') as f:
-                f.write(response_audio)
+        writes = [
+            (path, data) for path, data in (
+                (audio_path, answer_audio),
+                (question_audio_path, question_audio),
+                (response_audio_path, response_audio)
+            ) if path is not None
+        ]
+        if writes:
+            list(_file_writer.map(lambda write: write[0].write_bytes(write[1]), writes))
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self._remove_files_on_error([path for path, _ in writes]), self._connection() as conn:
             cursor = conn.cursor()
             
             if question_id:
@@ -237,7 +438,7 @@ class LocalStorage:
                     str(audio_path) if audio_path else None,
                     response,
                     str(response_audio_path) if response_audio_path else None,
-                    datetime.now().isoformat(),
+                    now_iso,
                     question_id,
                     drawing_id
                 ))
@@ -256,16 +457,15 @@ class LocalStorage:
                     str(question_audio_path) if question_audio_path else None,
                     response,
                     str(response_audio_path) if response_audio_path else None,
-                    datetime.now().isoformat()
+                    now_iso
                 ))
                 response_id = cursor.lastrowid
                 
-            conn.commit()
             return response_id
     
     def get_drawing(self, drawing_id: int) -> Dict[str, Any]:
         """Get drawing data by ID."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT id, session_id, image_path, caption, analysis, timestamp
@@ -279,41 +479,92 @@ class LocalStorage:
                     'session_id': row[1],
                     'image_path': row[2],
                     'caption': row[3],
-                    'analysis': json.loads(row[4]) if row[4] else {},
+                    'analysis': orjson.loads(row[4]) if row[4] else {},
                     'timestamp': row[5]
                 }
             return None
     
-    def get_session(self, session_id: int) -> Dict[str, Any]:
-        """Get complete session data including drawings and responses."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+    def get_session(self, session_id: int) -> Optional[Dict[str, Any]]:
+        """Get complete session data including drawings and responses, or None if missing."""
+        with self._connection() as conn:
             cursor = conn.cursor()
             
             # Get session data
-            cursor.execute('SELECT * FROM sessions WHERE id = ?', (session_id,))
-            session = dict(cursor.fetchone())
+            cursor.execute('SELECT id, timestamp, prompt FROM sessions WHERE id = ?', (session_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            session = {'id': row['id'], 'timestamp': row['timestamp'], 'prompt': row['prompt']}
             
-            # Get drawings
-            cursor.execute('SELECT * FROM drawings WHERE session_id = ?', (session_id,))
-            drawings = [dict(row) for row in cursor.fetchall()]
+            # Get drawings with their responses in one pass; drawings without
+            # responses come back once with NULL response columns
+            cursor.execute('''
+                SELECT d.id, d.session_id, d.image_path, d.caption, d.analysis, d.timestamp,
+                       r.id AS r_id, r.question, r.answer, r.answer_audio_path,
+                       r.question_audio_path, r.response, r.response_audio_path,
+                       r.timestamp AS r_timestamp
+                FROM drawings d LEFT JOIN responses r ON r.drawing_id = d.id
+                WHERE d.session_id = ?
+                ORDER BY d.id, r.id
+            ''', (session_id,))
+            drawings = {}
+            for row in cursor.fetchall():
+                drawing = drawings.get(row['id'])
+                if drawing is None:
+                    drawing = drawings[row['id']] = {
+                        'id': row['id'],
+                        'session_id': row['session_id'],
+                        'image_path': row['image_path'],
+                        'caption': row['caption'],
+                        'analysis': orjson.loads(row['analysis']) if row['analysis'] else row['analysis'],
+                        'timestamp': row['timestamp'],
+                        'responses': [],
+                        'tags': []
+                    }
+                if row['r_id'] is not None:
+                    drawing['responses'].append({
+                        'id': row['r_id'],
+                        'drawing_id': row['id'],
+                        'question': row['question'],
+                        'answer': row['answer'],
+                        'answer_audio_path': row['answer_audio_path'],
+                        'question_audio_path': row['question_audio_path'],
+                        'response': row['response'],
+                        'response_audio_path': row['response_audio_path'],
+                        'timestamp': row['r_timestamp']
+                    })
             
-            # For each drawing, get responses and tags
-            for drawing in drawings:
-                # Get responses
-                cursor.execute('SELECT * FROM responses WHERE drawing_id = ?', (drawing['id'],))
-                drawing['responses'] = [dict(row) for row in cursor.fetchall()]
-                
-                # Get tags
-                cursor.execute('SELECT tag FROM tags WHERE drawing_id = ?', (drawing['id'],))
-                drawing['tags'] = [row[0] for row in cursor.fetchall()]
-                
-                # Parse analysis JSON
-                if drawing['analysis']:
-                    drawing['analysis'] = json.loads(drawing['analysis'])
+            # Get tags for all drawings at once, joined with the unit separator
+            cursor.execute('''
+                SELECT drawing_id, GROUP_CONCAT(tag, CHAR(31)) AS tags
+                FROM tags
+                WHERE drawing_id IN (SELECT id FROM drawings WHERE session_id = ?)
+                GROUP BY drawing_id
+            ''', (session_id,))
+            for row in cursor.fetchall():
+                drawings[row['drawing_id']]['tags'] = row['tags'].split('\x1f')
             
-            session['drawings'] = drawings
+            session['drawings'] = list(drawings.values())
             return session
 
+class _LazyStorage:
+    """
+    Stands in for the LocalStorage singleton and creates it on first attribute
+    access, so importing this module does not open or migrate the database.
+    """
+    
+    def __init__(self):
+        self._instance = None
+        self._lock = threading.Lock()
+    
+    def __getattr__(self, name):
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = LocalStorage()
+                instance = self._instance
+        return getattr(instance, name)
+
 # Initialize storage
-local_storage = LocalStorage()
+local_storage = _LazyStorage()